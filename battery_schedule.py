@@ -1,9 +1,73 @@
-from flask import Flask, request, jsonify
-import pandas as pd
+from __future__ import annotations
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from flask import Flask, Response, request, jsonify
+import numpy as np
 from utils import schedule_battery, compute_soc_schedule 
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 app = Flask(__name__)
 
+# Prices are constant, so build them once; read-only since requests share them
+_DOWN_PRICES = np.array([7, 2, 3, 4, 1, 6, 7, 2, 3, 4, 1, 6, 7, 2, 3, 4, 1, 6, 7, 2, 3, 4, 1, 6], dtype=float)
+_UP_PRICES = np.array([8, 3, 4, 5, 2, 7, 8, 3, 4, 5, 2, 7, 8, 3, 4, 5, 2, 7, 8, 3, 4, 5, 2, 7], dtype=float)
+_DOWN_PRICES.setflags(write=False)
+_UP_PRICES.setflags(write=False)
+
+@dataclass(frozen=True)
+class ScheduleParams:
+    """Query parameters of the /schedule endpoint, with their defaults."""
+    soc_start: float = 20.0
+    soc_max: float = 90.0
+    soc_min: float = 10.0
+    soc_target: float = 90.0
+    power_capacity: float = 10.0
+    storage_capacity: float = 100.0
+    conversion_efficiency: float = 1.0
+    top_up: bool = False
+
+    @classmethod
+    def from_args(cls, args) -> ScheduleParams:
+        """Parse query arguments (e.g. `soc-start`) in a single pass.
+
+        :param args:    Request query arguments; the first value of each key is used.
+        :raises ValueError: If a numeric parameter is not a valid number.
+        """
+        values = args.to_dict()
+        params = {}
+        for field in _FLOAT_PARAMS:
+            name = field.replace('_', '-')
+            if name in values:
+                try:
+                    params[field] = float(values[name])
+                except ValueError:
+                    raise ValueError(f"Query parameter '{name}' must be a number, got {values[name]!r}") from None
+        if 'top-up' in values:
+            params['top_up'] = values['top-up'].lower() == 'true'
+        return cls(**params)
+
+_FLOAT_PARAMS = tuple(field for field in ScheduleParams.__dataclass_fields__ if field != 'top_up')
+
+@lru_cache(maxsize=512)
+def _solve(params: ScheduleParams) -> tuple[float, tuple[float, ...]]:
+    """Schedule the battery against the module-level prices, caching results for identical parameters.
+
+    The prices are constant, so the parameters alone identify a solve; if prices ever become
+    dynamic, a price version key must be added to the arguments.
+    """
+    costs, power_schedule = schedule_battery(up_prices=_UP_PRICES, down_prices=_DOWN_PRICES, **asdict(params))
+    return costs, tuple(power_schedule)
+
+def _schedule_response(payload: dict):
+    """Serialize a schedule payload, writing NumPy arrays directly with orjson when it is installed."""
+    if orjson is not None:
+        return Response(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), mimetype='application/json')
+    return jsonify({key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in payload.items()})
+
 @app.route('/schedule', methods=['GET'])
 def get_schedule():
     """
@@ -28,40 +92,16 @@ def get_schedule():
     
     try:
         # Extract parameters from query string
-        soc_start = float(request.args.get('soc-start', 20.0))
-        soc_max = float(request.args.get('soc-max', 90.0))
-        soc_min = float(request.args.get('soc-min', 10.0))
-        soc_target = float(request.args.get('soc-target', 90.0))
-        power_capacity = float(request.args.get('power-capacity', 10.0))
-        storage_capacity = float(request.args.get('storage-capacity', 100.0))
-        conversion_efficiency = float(request.args.get('conversion-efficiency', 1.0))
-        top_up = request.args.get('top-up', 'false').lower() == 'true'
-
-        # Prepare the data
-        raw_prices = dict(
-            production=[7, 2, 3, 4, 1, 6, 7, 2, 3, 4, 1, 6, 7, 2, 3, 4, 1, 6, 7, 2, 3, 4, 1, 6],
-            consumption=[8, 3, 4, 5, 2, 7, 8, 3, 4, 5, 2, 7, 8, 3, 4, 5, 2, 7, 8, 3, 4, 5, 2, 7],
-        )
+        params = ScheduleParams.from_args(request.args)
 
-        prices = pd.DataFrame(raw_prices, index=pd.date_range("2000-01-01T00:00+01", periods=len(raw_prices["consumption"]), freq="1H", inclusive="left"))
-        
         # Call the scheduling function
-        costs, power_schedule = schedule_battery(
-            prices=prices,
-            soc_start=soc_start,
-            soc_max=soc_max,
-            soc_min=soc_min,
-            soc_target=soc_target,
-            storage_capacity=storage_capacity,
-            power_capacity=power_capacity,
-            conversion_efficiency=conversion_efficiency,
-            top_up=top_up
-        )
+        costs, power_schedule = _solve(params)
+        power_schedule = np.asarray(power_schedule, dtype=float)
         
-        soc_schedule = compute_soc_schedule(power_schedule, soc_start, conversion_efficiency)
+        soc_schedule = compute_soc_schedule(power_schedule, params.soc_start, params.conversion_efficiency)
         
         # Return the result as JSON
-        return jsonify({
+        return _schedule_response({
             'costs': costs,
             'power_schedule': power_schedule,
             'soc_schedule': soc_schedule
@@ -74,4 +114,7 @@ def get_schedule():
         return jsonify({'error': f"An unexpected error occurred: {str(e)}"}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only; in production serve `battery_schedule:app` with a WSGI server,
+    # e.g. `gunicorn -w 4 battery_schedule:app`. Solves are serialized within a process,
+    # so run several worker processes to solve requests in parallel
+    app.run(host='0.0.0.0', threaded=True, debug=False)
\ No newline at end of file
@@ -1,6 +1,6 @@
 import unittest
 from flask import Flask
-from battery_schedule import app 
+from battery_schedule import app, _solve
 
 class TestScheduleAPI(unittest.TestCase):
 
@@ -27,6 +27,25 @@ class TestScheduleAPI(unittest.TestCase):
         self.assertIn('power_schedule', data)
         self.assertIn('soc_schedule', data)
 
+    def test_repeated_request(self):
+        # Identical requests are served from the cache and return the same schedule
+        _solve.cache_clear()
+        first = self.client.get('/schedule?top-up=false&soc-start=30').get_json()
+        second = self.client.get('/schedule?top-up=false&soc-start=30').get_json()
+        self.assertEqual(first, second)
+        self.assertEqual(_solve.cache_info().hits, 1)
+        self.assertEqual(_solve.cache_info().currsize, 1)
+
+    def test_failed_request_not_cached(self):
+        # Requests that fail to solve are not cached and fail again on repeat
+        _solve.cache_clear()
+        for _ in range(2):
+            response = self.client.get('/schedule?top-up=false&soc-target=150')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(_solve.cache_info().misses, 2)
+        self.assertEqual(_solve.cache_info().hits, 0)
+        self.assertEqual(_solve.cache_info().currsize, 0)
+
     def test_infeasible_soc_target(self):
         # Mock a case where the SOC target is infeasible
         response = self.client.get('/schedule?top-up=false&soc-target=150')
@@ -41,5 +60,12 @@ class TestScheduleAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIn('error', data)
 
+    def test_non_numeric_parameter(self):
+        # Simulate a scenario with a parameter that is not a number
+        response = self.client.get('/schedule?soc-start=abc')
+        data = response.get_json()
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('soc-start', data['error'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
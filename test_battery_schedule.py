@@ -1,5 +1,9 @@
+import importlib.util
+import sys
 import unittest
+from unittest import mock
 import pandas as pd
+import utils
 from utils import schedule_battery, compute_soc_schedule
 
 class TestScheduler(unittest.TestCase):
@@ -53,6 +57,123 @@ class TestScheduler(unittest.TestCase):
         # Check that the final SOC reaches the storage capacity
         self.assertAlmostEqual(soc_schedule[-1], 100.0, delta=1e-2)
 
+    def test_pyomo_backend_matches_highs(self):
+        # The direct HiGHS LP and the Pyomo model should reach the same optimum
+        params = dict(
+            soc_start=20.0,
+            soc_max=90.0,
+            soc_min=10.0,
+            soc_target=60.0,
+            power_capacity=10.0,
+            storage_capacity=100.0,
+            conversion_efficiency=0.9,
+            top_up=False
+        )
+        costs, power_schedule = schedule_battery(prices=self.prices, **params)
+        with mock.patch.object(utils, "USE_PYOMO", True):
+            pyomo_costs, pyomo_power_schedule = schedule_battery(prices=self.prices, **params)
+
+        self.assertAlmostEqual(costs, pyomo_costs, delta=1e-6)
+        self.assertEqual(len(power_schedule), len(pyomo_power_schedule))
+
+    def test_greedy_matches_lp(self):
+        # Without arbitrage opportunities the closed-form schedule should match the LP optimum
+        prices = self.prices.assign(production=self.prices["production"].clip(upper=2))
+        for soc_start, soc_target in [(20.0, 90.0), (80.0, 15.0), (50.0, 50.0)]:
+            params = dict(
+                soc_start=soc_start,
+                soc_max=90.0,
+                soc_min=10.0,
+                soc_target=soc_target,
+                power_capacity=4.0,
+                storage_capacity=100.0,
+                conversion_efficiency=1.0,
+                top_up=False
+            )
+            costs, power_schedule = schedule_battery(prices=prices, **params)
+            with mock.patch.object(utils, "USE_PYOMO", True):
+                lp_costs, _ = schedule_battery(prices=prices, **params)
+            soc_schedule = compute_soc_schedule(power_schedule, soc_start=soc_start, conversion_efficiency=1.0)
+
+            self.assertAlmostEqual(costs, lp_costs, delta=1e-6)
+            self.assertAlmostEqual(soc_schedule[-1], soc_target, delta=1e-6)
+            self.assertTrue(all(abs(power) <= 4.0 for power in power_schedule))
+
+    def test_price_arrays_match_dataframe(self):
+        # Passing the price columns as arrays should give the same schedule as the DataFrame
+        params = dict(
+            soc_start=20.0,
+            soc_max=90.0,
+            soc_min=10.0,
+            soc_target=90.0,
+            power_capacity=10.0,
+            storage_capacity=100.0,
+            conversion_efficiency=1.0,
+            top_up=False
+        )
+        costs, power_schedule = schedule_battery(prices=self.prices, **params)
+        array_costs, array_power_schedule = schedule_battery(
+            up_prices=self.prices["consumption"].to_numpy(),
+            down_prices=self.prices["production"].to_numpy(),
+            **params
+        )
+
+        self.assertAlmostEqual(costs, array_costs, delta=1e-6)
+        self.assertEqual(power_schedule, array_power_schedule)
+
+    def test_power_capacity_bounds_each_direction(self):
+        # Charging and discharging are each limited by power_capacity, so SoC cannot be burnt off
+        # by charging and discharging beyond power_capacity in the same step
+        with self.assertRaises(ValueError):
+            schedule_battery(
+                prices=self.prices,
+                soc_start=50,
+                soc_max=90,
+                soc_min=10,
+                soc_target=10,
+                power_capacity=0.5,
+                storage_capacity=100,
+                conversion_efficiency=0.9,
+                top_up=False
+            )
+
+        costs, power_schedule = schedule_battery(
+            prices=self.prices,
+            soc_start=50.0,
+            soc_max=90.0,
+            soc_min=10.0,
+            soc_target=40.0,
+            power_capacity=0.5,
+            storage_capacity=100.0,
+            conversion_efficiency=0.9,
+            top_up=False
+        )
+        soc_schedule = compute_soc_schedule(power_schedule, soc_start=50.0, conversion_efficiency=0.9)
+
+        self.assertTrue(all(abs(power) <= 0.5 + 1e-9 for power in power_schedule))
+        self.assertAlmostEqual(soc_schedule[-1], 40.0, delta=1e-2)
+
+    def test_import_without_highspy(self):
+        # utils must import without highspy; only the direct LP path then fails, with a RuntimeError
+        spec = importlib.util.spec_from_file_location("utils_without_highspy", utils.__file__)
+        module = importlib.util.module_from_spec(spec)
+        with mock.patch.dict(sys.modules, {"highspy": None}):
+            spec.loader.exec_module(module)
+
+        self.assertIsNone(module.highspy)
+        with self.assertRaises(RuntimeError):
+            module.schedule_battery(
+                prices=self.prices,
+                soc_start=20.0,
+                soc_max=90.0,
+                soc_min=10.0,
+                soc_target=90.0,
+                power_capacity=10.0,
+                storage_capacity=100.0,
+                conversion_efficiency=1.0,
+                top_up=False
+            )
+
     def test_infeasible_soc_target(self):
         # Test for infeasible SOC target (e.g., target higher than storage capacity)
         with self.assertRaises(ValueError):
@@ -83,6 +204,57 @@ class TestScheduler(unittest.TestCase):
                 top_up=False
             )
 
+    def test_unreachable_discharge_target(self):
+        # Discharging 80 at power capacity 1 with losses takes more than 24 steps
+        with mock.patch.object(utils, "_schedule_battery_highs") as solve:
+            with self.assertRaisesRegex(ValueError, "cannot be reached"):
+                schedule_battery(
+                    prices=self.prices,
+                    soc_start=90,
+                    soc_max=90,
+                    soc_min=10,
+                    soc_target=10,
+                    power_capacity=1,
+                    storage_capacity=100,
+                    conversion_efficiency=0.9,
+                    top_up=False
+                )
+        solve.assert_not_called()
+
+    def test_unreachable_top_up(self):
+        # soc_target alone is reachable, but topping up to storage_capacity is not
+        with mock.patch.object(utils, "_schedule_battery_highs") as solve:
+            with self.assertRaisesRegex(ValueError, "cannot be reached"):
+                schedule_battery(
+                    prices=self.prices,
+                    soc_start=20,
+                    soc_max=90,
+                    soc_min=10,
+                    soc_target=30,
+                    power_capacity=1,
+                    storage_capacity=100,
+                    conversion_efficiency=1.0,
+                    top_up=True
+                )
+        solve.assert_not_called()
+
+    def test_unreachable_target_skips_solver(self):
+        # The charging branch should also fail before the LP is built or solved
+        with mock.patch.object(utils, "_schedule_battery_highs") as solve:
+            with self.assertRaisesRegex(ValueError, "cannot be reached"):
+                schedule_battery(
+                    prices=self.prices,
+                    soc_start=20,
+                    soc_max=90,
+                    soc_min=10,
+                    soc_target=90,
+                    power_capacity=1,
+                    storage_capacity=100,
+                    conversion_efficiency=0.9,
+                    top_up=False
+                )
+        solve.assert_not_called()
+
     def test_invalid_soc_bounds(self):
         # Test with invalid SOC bounds (min >= max)
         with self.assertRaises(ValueError):
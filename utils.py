@@ -1,11 +1,13 @@
 from __future__ import annotations
+import logging
+import os
+import threading
 import numpy as np
 import pandas as pd
 from pyomo.core import (
     ConcreteModel,
     Var,
     RangeSet,
-    Param,
     Reals,
     NonNegativeReals,
     NonPositiveReals,
@@ -13,23 +15,83 @@ from pyomo.core import (
     Objective,
     minimize
 )
+from pyomo.core.expr.numeric_expr import LinearExpression
 from pyomo.environ import value
 
 from pyomo.opt import SolverFactory, SolverStatus, TerminationCondition
 
-def compute_soc_schedule(power_schedule: list[float], soc_start: float, conversion_efficiency: float) -> list[float]:
+# HiGHS is optional at import time; only the direct LP path needs it
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+logger = logging.getLogger(__name__)
+
+# Build and solve the Pyomo model instead of passing the LP to HiGHS directly (useful for debugging)
+USE_PYOMO = os.environ.get("BATTERY_SCHEDULE_USE_PYOMO", "false").lower() == "true"
+
+EXCESS_SOC_PENALTY = 1000  # Arbitrary penalty factor
+
+INFEASIBLE_MESSAGE = ("The optimization problem is infeasible with the given parameters. Possible causes could be: "
+                      "1) The power capacity is insufficient to meet the target SoC. "
+                      "2) The target SoC is not achievable given the initial state and other constraints. "
+                      "3) Conflicting constraints make the problem unsolvable.")
+
+def _create_solver():
+    """Create a HiGHS solver with console output switched off."""
+    solver = SolverFactory("appsi_highs")
+    solver.options["output_flag"] = False
+    solver.options["presolve"] = "on"
+    return solver
+
+# Solvers are created on first use and reused across calls; the appsi solver only
+# serves the BATTERY_SCHEDULE_USE_PYOMO debug path
+_SOLVER = None
+_HIGHS = None
+
+# Both solvers keep per-model state (and the appsi one redirects process-wide file descriptors
+# while solving), so concurrent solves (e.g. Flask in threaded mode) must be serialized
+_SOLVER_LOCK = threading.Lock()
+
+def _get_solver():
+    """Return the shared appsi HiGHS solver, creating it on first use."""
+    global _SOLVER
+    if _SOLVER is None:
+        _SOLVER = _create_solver()
+    return _SOLVER
+
+def _get_highs() -> highspy.Highs:
+    """Return the shared direct HiGHS instance, creating it on first use."""
+    global _HIGHS
+    if _HIGHS is None:
+        _HIGHS = highspy.Highs()
+        _HIGHS.setOptionValue("output_flag", False)
+        _HIGHS.setOptionValue("presolve", "on")
+    return _HIGHS
+
+def compute_soc_schedule(power_schedule: list[float], soc_start: float, conversion_efficiency: float) -> np.ndarray:
     """Determine the scheduled state of charge (SoC), given a power schedule, a starting SoC and the conversion efficiency.
 
     :param power_schedule:          List of power changes (positive for charging, negative for discharging).
     :param soc_start:               Initial state of charge at the beginning of the schedule.
     :param conversion_efficiency:   Efficiency of the charge/discharge process. 
+    :returns:                       Array of length len(power_schedule) + 1, starting with soc_start.
     """
     
-    adjusted__power_schedule = [power * conversion_efficiency if power > 0 else power / conversion_efficiency for power in power_schedule]
-    return [soc_start] + list(np.cumsum(adjusted__power_schedule) + soc_start)
+    power = np.asarray(power_schedule, dtype=float)
+    adjusted_power_schedule = np.where(power > 0, power * conversion_efficiency, power / conversion_efficiency)
+    soc_schedule = np.empty(len(power) + 1)
+    soc_schedule[0] = soc_start
+    np.cumsum(adjusted_power_schedule, out=soc_schedule[1:])
+    soc_schedule[1:] += soc_start
+    return soc_schedule
 
 def schedule_battery(
-    prices: pd.DataFrame,
+    prices: pd.DataFrame | None = None,
+    *,
+    up_prices: np.ndarray | None = None,
+    down_prices: np.ndarray | None = None,
     soc_start: float,
     soc_max: float,
     soc_min: float,
@@ -42,6 +104,9 @@ def schedule_battery(
     """Schedule a battery against given consumption and production prices.
     
     :param prices:                  Pandas DataFrame with columns "consumption" and "production" containing prices.
+                                    Kept for backward compatibility; prefer up_prices and down_prices.
+    :param up_prices:               Consumption prices per time step, paid when charging.
+    :param down_prices:             Production prices per time step, received when discharging.
     :param soc_start:               State of charge at the start of the schedule.
     :param soc_max:                 Maximum state of charge.
     :param soc_min:                 Minimum state of charge.
@@ -52,8 +117,20 @@ def schedule_battery(
     :param top_up:                  Boolean flag to indicate if top-up to full capacity is required.
     """
     
+    if prices is not None:
+        up_prices = prices["consumption"].to_numpy(dtype=float)
+        down_prices = prices["production"].to_numpy(dtype=float)
+    elif up_prices is None or down_prices is None:
+        raise TypeError("schedule_battery() requires either prices or both up_prices and down_prices")
+    else:
+        up_prices = np.asarray(up_prices, dtype=float)
+        down_prices = np.asarray(down_prices, dtype=float)
+
     # Pre-check logical constraints before running the optimization
 
+    if len(up_prices) != len(down_prices):
+        raise ValueError(f"up_prices ({len(up_prices)} steps) and down_prices ({len(down_prices)} steps) must have the same length")
+
     # Check if SOC min and max make sense
     if soc_min >= soc_max:
         raise ValueError(f"soc_min ({soc_min}%) must be less than soc_max ({soc_max}%)")
@@ -72,132 +149,245 @@ def schedule_battery(
     if power_capacity <= 0:
         raise ValueError(f"power_capacity ({power_capacity} kW) must be positive")
 
-    model = ConcreteModel()
-    model.j = RangeSet(0, len(prices.index.to_pydatetime()) - 1, doc="Set of datetimes")
-    model.ems_power = Var(model.j, domain=Reals, initialize=0)
-    model.device_power_down = Var(model.j, domain=NonPositiveReals, initialize=0)
-    model.device_power_up = Var(model.j, domain=NonNegativeReals, initialize=0)
+    T = len(up_prices)
+
+    # Check if the final SOC can be reached at all in T steps at full power
+    soc_end = storage_capacity if top_up else soc_target
+    max_delta_up = power_capacity * conversion_efficiency * T
+    max_delta_down = power_capacity / conversion_efficiency * T
+    if soc_end > soc_start + max_delta_up:
+        raise ValueError(f"final SoC ({soc_end}) cannot be reached from soc_start ({soc_start}) within {T} steps: "
+                         f"charging at power_capacity ({power_capacity} kW) adds at most {max_delta_up}")
+    if soc_end < soc_start - max_delta_down:
+        raise ValueError(f"final SoC ({soc_end}) cannot be reached from soc_start ({soc_start}) within {T} steps: "
+                         f"discharging at power_capacity ({power_capacity} kW) removes at most {max_delta_down}")
+
+    # Without conversion losses and with no hour selling above any hour's buying price, trading back and
+    # forth never pays off, so the optimum only moves the net energy needed and the SoC bounds cannot bind
+    if not USE_PYOMO and conversion_efficiency == 1.0 and not top_up and down_prices.max() <= up_prices.min():
+        return _schedule_battery_greedy(up_prices, down_prices, soc_start, soc_target, power_capacity)
+
+    # SoC bounds per time step; the last step pins the SoC to its target
+    soc_lower = np.full(T, soc_min, dtype=float)
+    if top_up:
+        # Allow SoC to go up to storage_capacity during the schedule, ending exactly at storage_capacity
+        soc_upper = np.full(T, 100, dtype=float)
+        soc_lower[-1] = soc_upper[-1] = storage_capacity
+    else:
+        # Stay within SoC bounds (soc_min and soc_max) and end at soc_target
+        soc_upper = np.full(T, soc_max, dtype=float)
+        soc_lower[-1] = soc_upper[-1] = soc_target
+
+    schedule = _schedule_battery_pyomo if USE_PYOMO else _schedule_battery_highs
+    return schedule(
+        up_prices=up_prices,
+        down_prices=down_prices,
+        soc_lower=soc_lower,
+        soc_upper=soc_upper,
+        soc_start=soc_start,
+        soc_max=soc_max,
+        power_capacity=power_capacity,
+        conversion_efficiency=conversion_efficiency,
+    )
+
+def _schedule_battery_greedy(
+    up_prices: np.ndarray,
+    down_prices: np.ndarray,
+    soc_start: float,
+    soc_target: float,
+    power_capacity: float
+) -> tuple[float, list[float]]:
+    """Schedule the net energy change from soc_start to soc_target in closed form.
+
+    Charges at full power in the cheapest consumption hours, or discharges at full power in the
+    most expensive production hours, until the required energy is met. Only optimal for a lossless
+    battery whose production prices never exceed its consumption prices.
+    """
+    T = len(up_prices)
+    energy = soc_target - soc_start
+
+    if energy >= 0:
+        hour_prices = up_prices
+        order = np.argsort(up_prices, kind="stable")
+    else:
+        hour_prices = down_prices
+        order = np.argsort(-down_prices, kind="stable")
 
-    def price_up_select(m, j):
-        return prices["consumption"].iloc[j]
+    # Fill hours in price order at full power, with the remainder in the last hour used
+    power = np.clip(abs(energy) - power_capacity * np.arange(T), 0, power_capacity)
+    planned_device_power = np.zeros(T)
+    planned_device_power[order] = np.sign(energy) * power
+    planned_costs = float(planned_device_power @ hour_prices)
+    return planned_costs, planned_device_power.tolist()
 
-    def price_down_select(m, j):
-        return prices["production"].iloc[j]
+def _schedule_battery_highs(
+    up_prices: np.ndarray,
+    down_prices: np.ndarray,
+    soc_lower: np.ndarray,
+    soc_upper: np.ndarray,
+    soc_start: float,
+    soc_max: float,
+    power_capacity: float,
+    conversion_efficiency: float
+) -> tuple[float, list[float]]:
+    """Solve the scheduling LP by passing its matrix directly to HiGHS.
+
+    Columns are [device_power_up, device_power_down, soc, excess_soc], each of length T.
+    Rows are the SoC recurrence (T equalities) followed by the excess SoC definition (T inequalities).
+    """
+    if highspy is None:
+        raise RuntimeError("highspy is not installed; install it or set BATTERY_SCHEDULE_USE_PYOMO=true")
+
+    T = len(up_prices)
+    up, down, soc, excess = (np.arange(T) + k * T for k in range(4))
+    recurrence_rows = np.arange(T)
+    excess_rows = np.arange(T) + T
 
-    model.up_price = Param(model.j, initialize=price_up_select)
-    model.down_price = Param(model.j, initialize=price_down_select)
+    # soc[j] - soc[j-1] - device_power_down[j] / eff - device_power_up[j] * eff == (soc_start if j == 0 else 0)
+    # excess_soc[j] - soc[j] >= -soc_max
+    rows = np.concatenate([recurrence_rows, recurrence_rows[1:], recurrence_rows, recurrence_rows, excess_rows, excess_rows])
+    cols = np.concatenate([soc, soc[:-1], down, up, excess, soc])
+    values = np.concatenate([
+        np.ones(T),
+        -np.ones(T - 1),
+        np.full(T, -1 / conversion_efficiency),
+        np.full(T, -conversion_efficiency),
+        np.ones(T),
+        -np.ones(T),
+    ])
+    order = np.lexsort((rows, cols))
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = 4 * T
+    lp.num_row_ = 2 * T
+    lp.col_cost_ = np.concatenate([up_prices, down_prices, np.zeros(T), np.full(T, float(EXCESS_SOC_PENALTY))])
+    lp.col_lower_ = np.concatenate([np.zeros(T), np.full(T, -power_capacity), soc_lower, np.zeros(T)])
+    lp.col_upper_ = np.concatenate([np.full(T, power_capacity), np.zeros(T), soc_upper, np.full(T, highspy.kHighsInf)])
+    recurrence_rhs = np.zeros(T)
+    recurrence_rhs[0] = soc_start
+    lp.row_lower_ = np.concatenate([recurrence_rhs, np.full(T, -soc_max)])
+    lp.row_upper_ = np.concatenate([recurrence_rhs, np.full(T, highspy.kHighsInf)])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = np.concatenate([[0], np.cumsum(np.bincount(cols, minlength=4 * T))])
+    lp.a_matrix_.index_ = rows[order]
+    lp.a_matrix_.value_ = values[order]
+
+    with _SOLVER_LOCK:
+        highs = _get_highs()
+        highs.passModel(lp)
+        highs.run()
+        status = highs.getModelStatus()
+        status_name = highs.modelStatusToString(status)
+        col_value = np.array(highs.getSolution().col_value) if status == highspy.HighsModelStatus.kOptimal else None
+    logger.debug("Solver model status: %s", status_name)
+
+    if status == highspy.HighsModelStatus.kOptimal:
+        device_power_up = col_value[up]
+        device_power_down = col_value[down]
+        planned_costs = float(device_power_up @ up_prices + device_power_down @ down_prices)
+        # The net power flow is the sum of the charging and discharging parts
+        planned_device_power = (device_power_up + device_power_down).tolist()
+        return planned_costs, planned_device_power
+    # Every column is bounded or has a nonnegative cost, so the LP cannot be unbounded
+    elif status in (highspy.HighsModelStatus.kInfeasible, highspy.HighsModelStatus.kUnboundedOrInfeasible):
+        raise ValueError(INFEASIBLE_MESSAGE)
+    else:
+        raise RuntimeError(f"Solver failed with model status: {status_name}")
+
+def _schedule_battery_pyomo(
+    up_prices: np.ndarray,
+    down_prices: np.ndarray,
+    soc_lower: np.ndarray,
+    soc_upper: np.ndarray,
+    soc_start: float,
+    soc_max: float,
+    power_capacity: float,
+    conversion_efficiency: float
+) -> tuple[float, list[float]]:
+    """Solve the scheduling LP by building a Pyomo model and solving it through the appsi HiGHS interface."""
+    T = len(up_prices)
 
-    model.device_max = Param(model.j, initialize=soc_max)
-    model.device_min = Param(model.j, initialize=soc_min)
+    model = ConcreteModel()
+    model.j = RangeSet(0, T - 1, doc="Set of datetimes")
+    # Power limits are variable bounds rather than constraint rows, which HiGHS handles far more cheaply
+    model.device_power_down = Var(model.j, domain=NonPositiveReals, bounds=(-power_capacity, 0), initialize=0)
+    model.device_power_up = Var(model.j, domain=NonNegativeReals, bounds=(0, power_capacity), initialize=0)
+    model.soc = Var(model.j, domain=Reals, initialize=soc_start)
 
     # Auxiliary variable to capture excess over soc-max
     model.excess_soc = Var(model.j, domain=NonNegativeReals, initialize=0)
 
-    def ems_derivative_bounds(m, j):
-        return (
-            -power_capacity,
-            m.ems_power[j],
-            power_capacity,
-        )
-    
+    # Build the linear expressions directly in one pass, so the constraint rules below only wrap them
+    # soc[j] - soc[j-1] - device_power_down[j] / eff - device_power_up[j] * eff - (soc_start if j == 0)
+    soc_recurrence_exprs = []
+    for j in range(T):
+        linear_coefs = [1.0, -1 / conversion_efficiency, -conversion_efficiency]
+        linear_vars = [model.soc[j], model.device_power_down[j], model.device_power_up[j]]
+        if j > 0:
+            linear_coefs.append(-1.0)
+            linear_vars.append(model.soc[j - 1])
+        soc_recurrence_exprs.append(LinearExpression(
+            constant=-soc_start if j == 0 else 0.0,
+            linear_coefs=linear_coefs,
+            linear_vars=linear_vars,
+        ))
+
+    # excess_soc[j] - soc[j]
+    excess_soc_exprs = [
+        LinearExpression(constant=0.0, linear_coefs=[1.0, -1.0], linear_vars=[model.excess_soc[j], model.soc[j]])
+        for j in range(T)
+    ]
+
+    def soc_recurrence(m, j):
+        """Carry the state of charge over from the previous time step."""
+        return soc_recurrence_exprs[j] == 0
+
     def device_bounds(m, j):
-        stock_changes = [
-            (
-                m.device_power_down[k] / conversion_efficiency  
-                + m.device_power_up[k] * conversion_efficiency 
-            )
-            for k in range(0, j + 1)
-        ]
-
-        if top_up:
-            # If it's the last time step, the SoC should be exactly the storage_capacity
-            if j == len(prices) - 1:
-                return (
-                    storage_capacity,
-                    soc_start + sum(stock_changes),
-                    storage_capacity,
-                )
-            else:
-                # Allow SoC to go up to storage_capacity during the schedule
-                return (
-                    m.device_min[j],
-                    soc_start + sum(stock_changes),
-                    100,
-                )
-        else:   
-            # Apply soc target and bounds when top_up is false
-            if j == len(prices) - 1:
-                return (
-                    soc_target,
-                    soc_start + sum(stock_changes),
-                    soc_target,
-                )
-
-            # Stay within SoC bounds (soc_min and soc_max)
-            return (
-                m.device_min[j],
-                soc_start + sum(stock_changes),
-                m.device_max[j],
-            )
-
-    def device_derivative_equalities(m, j):
-        """Determine aggregate flow ems_power."""
         return (
-            0,
-            m.device_power_up[j] + m.device_power_down[j] - m.ems_power[j],
-            0,
+            float(soc_lower[j]),
+            m.soc[j],
+            float(soc_upper[j]),
         )
 
-    model.device_power_up_bounds = Constraint(model.j, rule=ems_derivative_bounds)
-    model.device_power_equalities = Constraint(model.j, rule=device_derivative_equalities)
+    model.soc_recurrence = Constraint(model.j, rule=soc_recurrence)
     model.device_energy_bounds = Constraint(model.j, rule=device_bounds)
 
     def excess_soc_constraint(m, j):
-        stock_changes = sum(
-            m.device_power_down[k] / conversion_efficiency  
-            + m.device_power_up[k] * conversion_efficiency 
-            for k in range(0, j + 1)
-        )
-        soc_current = soc_start + stock_changes
-        # Ensure excess_soc is at least soc_current - m.device_max[j]
-        return m.excess_soc[j] >= soc_current - m.device_max[j]
+        # Ensure excess_soc is at least soc[j] - soc_max
+        return excess_soc_exprs[j] >= -soc_max
 
     model.excess_soc_constraint_lower = Constraint(model.j, rule=excess_soc_constraint)
 
-    # Add objective
-    def cost_function(m):
-        """Calculate the actual costs associated with charging/discharging."""
-        costs = 0
-        for j in m.j:
-            costs += m.device_power_down[j] * m.down_price[j]
-            costs += m.device_power_up[j] * m.up_price[j]
-        return costs
-    
-    # Define the penalty function
-    def penalty_function(m):
-        penalty_factor = 1000  # Arbitrary penalty factor
-        penalty = penalty_factor * sum(m.excess_soc[j] for j in m.j)
-        return penalty
-
-    model.costs = cost_function(model)
-    model.penalty = penalty_function(model)
+    # Actual costs associated with charging/discharging, with prices folded in as plain floats
+    model.costs = LinearExpression(
+        constant=0.0,
+        linear_coefs=down_prices.tolist() + up_prices.tolist(),
+        linear_vars=[model.device_power_down[j] for j in range(T)] + [model.device_power_up[j] for j in range(T)],
+    )
+    model.penalty = LinearExpression(
+        constant=0.0,
+        linear_coefs=[float(EXCESS_SOC_PENALTY)] * T,
+        linear_vars=[model.excess_soc[j] for j in range(T)],
+    )
 
     # The objective is to minimize both actual costs and penalties
     model.obj = Objective(expr=model.costs + model.penalty, sense=minimize)
-    solver = SolverFactory("appsi_highs")
-    results = solver.solve(model, load_solutions=False)
-    print(results.solver.termination_condition)
+    with _SOLVER_LOCK:
+        results = _get_solver().solve(model, load_solutions=False)
+    logger.debug("Solver termination condition: %s", results.solver.termination_condition)
 
     # Check for infeasibility
     if (results.solver.status == SolverStatus.ok) and (results.solver.termination_condition == TerminationCondition.optimal):
         model.solutions.load_from(results)
         planned_costs = value(model.costs)
-        planned_device_power = [model.ems_power[j].value for j in model.j]
+        # The net power flow is the sum of the charging and discharging parts
+        device_power_up = model.device_power_up.get_values()
+        device_power_down = model.device_power_down.get_values()
+        planned_device_power = np.fromiter(
+            (device_power_up[j] + device_power_down[j] for j in range(T)), dtype=float, count=T
+        ).tolist()
         return planned_costs, planned_device_power
     elif results.solver.termination_condition == TerminationCondition.infeasible:
-        raise ValueError("The optimization problem is infeasible with the given parameters. Possible causes could be: "
-                         "1) The power capacity is insufficient to meet the target SoC. "
-                         "2) The target SoC is not achievable given the initial state and other constraints. "
-                         "3) Conflicting constraints make the problem unsolvable.")
+        raise ValueError(INFEASIBLE_MESSAGE)
     else:
         raise RuntimeError(f"Solver failed with termination condition: {results.solver.termination_condition}")
\ No newline at end of file